@@ -17,10 +17,15 @@ We simply aggregate their released predictions by GTDB taxonomy.
 """
 
 import os
+import shutil
 import urllib.request
 import math
 import pandas as pd
 import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.csv as pacsv
+import pyarrow.dataset as ds
 
 RAW_DIR = "raw"
 CACHE_DIR = "cache"
@@ -29,10 +34,19 @@ CSV_URL = (
     "phydon_gtdb_ssu_with_OGT.csv"
 )
 CSV_FILE = os.path.join(RAW_DIR, "phydon_gtdb_ssu_with_OGT.csv")
+ALL_LEVELS_FILE = os.path.join(CACHE_DIR, "all_levels.arrow")
+# stamped into all_levels.arrow; bump when its layout changes so
+# growth_rate.py ignores files written by an older build.py
+ALL_LEVELS_FORMAT = "1"
 
 TAXONOMY_LEVELS = ["domain", "phylum", "class", "order", "family", "genus", "species"]
 TAXONOMY_PREFIXES = ["d__", "p__", "c__", "o__", "f__", "g__", "s__"]
 
+# Alongside cache/<level>.parquet, each level is written as a hive-partitioned
+# dataset keyed on the first character of its names (cache/genus/initial=p/…),
+# so an exact-name read only opens the one partition that can hold the name.
+PARTITIONING = ds.partitioning(pa.schema([("initial", pa.string())]), flavor="hive")
+
 
 def download_csv():
     os.makedirs(RAW_DIR, exist_ok=True)
@@ -44,62 +58,217 @@ def download_csv():
         print(f"{CSV_FILE} already exists, skipping download.")
 
 
-def parse_taxonomy(df: pd.DataFrame) -> pd.DataFrame:
+def parse_taxonomy(table: pa.Table) -> pa.Table:
     """Split the semicolon-delimited GTDB taxonomy string into columns."""
-    parts = df["taxonomy"].str.split(";", expand=True)
+    taxonomy = table["taxonomy"]
+    n_parts = pc.add(pc.count_substring(taxonomy, ";"), 1)
+    # pad every string to at least seven ranks so list_element never runs
+    # off the end; ranks a row doesn't have are masked back to null below
+    parts = pc.split_pattern(
+        pc.binary_join_element_wise(taxonomy, ";" * (len(TAXONOMY_LEVELS) - 1), ""), ";"
+    )
+    missing = pa.scalar(None, pa.string())
     for i, level in enumerate(TAXONOMY_LEVELS):
-        if i < parts.shape[1]:
-            # strip the prefix (e.g. "d__") and lowercase
-            df[level] = (
-                parts[i]
-                .str.replace(TAXONOMY_PREFIXES[i], "", regex=False)
-                .str.strip()
-                .str.lower()
+        # prefixes are fixed-width ("d__", "p__", …) so slice them off
+        # rather than searching each cell, then lowercase
+        rank = pc.utf8_lower(
+            pc.utf8_slice_codeunits(
+                pc.utf8_trim_whitespace(pc.list_element(parts, i)),
+                len(TAXONOMY_PREFIXES[i]),
             )
-        else:
-            df[level] = np.nan
-    return df
-
-
-def summarise_level(df: pd.DataFrame, level: str) -> pd.DataFrame:
-    """Group by the given taxonomic level and compute summary stats on combopred."""
-    # Build the grouping key: all levels from domain down to `level`
-    idx = TAXONOMY_LEVELS.index(level)
-    group_cols = TAXONOMY_LEVELS[: idx + 1]
-
-    grouped = df.dropna(subset=[level, "combopred"]).groupby(group_cols)
-
-    agg = grouped["combopred"].agg(
-        mean="mean",
-        median="median",
-        min="min",
-        max="max",
-        std="std",
-        count="count",
-    )
+        )
+        table = table.append_column(level, pc.if_else(pc.greater(n_parts, i), rank, missing))
+    return table
+
+
+def _summarise_runs(keys: pd.DataFrame, codes: np.ndarray, values: np.ndarray) -> pd.DataFrame:
+    """Compute summary stats on values grouped by integer codes.
+
+    `keys` holds one row per code (in code order) naming each group.
+    """
+    # Sort once by (group, value): every group becomes a contiguous, ordered
+    # run, so min/max/median are plain reads and sums are one reduceat.
+    order = np.lexsort((values, codes))
+    codes, values = codes[order], values[order]
+    starts = np.flatnonzero(np.diff(codes, prepend=-1))
+    count = np.diff(np.r_[starts, len(values)])
+    ends = starts + count - 1
+
+    if len(values):
+        mean = np.add.reduceat(values, starts) / count
+        sq_dev = np.add.reduceat((values - np.repeat(mean, count)) ** 2, starts)
+    else:
+        mean = sq_dev = np.empty(0)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        std = np.sqrt(sq_dev / (count - 1))  # NaN for single-member groups
+
+    agg = keys.reset_index(drop=True)
+    agg["mean"] = mean
+    agg["median"] = (values[starts + (count - 1) // 2] + values[starts + count // 2]) / 2
+    agg["min"] = values[starts]
+    agg["max"] = values[ends]
+    agg["std"] = std
+    agg["count"] = count
     agg["range"] = agg["max"] - agg["min"]
     agg["se"] = agg["std"] / np.sqrt(agg["count"])
-    agg = agg.reset_index()
     return agg
 
 
+def summarise_levels(df: pd.DataFrame):
+    """Yield (level, summary) for every taxonomic level, domain first.
+
+    The full table is grouped only once, on the complete lineage.  Each
+    level's groups are then found on that much smaller table of lineages
+    and mapped back to the raw rows as integer codes, so no level re-hashes
+    the taxonomy columns of every row.  Stats are computed from the raw
+    combopred values rather than rolled up from the lineage stats, since
+    the median does not decompose.
+    """
+    df = df.dropna(subset=["combopred"])
+    values = df["combopred"].to_numpy(dtype=float)
+
+    # one code per distinct lineage; NaN ranks are kept so that e.g. a row
+    # without a species still counts toward its genus
+    lineage_codes = (
+        df.groupby(TAXONOMY_LEVELS, observed=True, dropna=False).ngroup().to_numpy()
+    )
+    first = np.unique(lineage_codes, return_index=True)[1]
+    lineages = df[TAXONOMY_LEVELS].iloc[first].reset_index(drop=True)
+
+    for idx, level in enumerate(TAXONOMY_LEVELS):
+        # Build the grouping key: all levels from domain down to `level`
+        group_cols = TAXONOMY_LEVELS[: idx + 1]
+        keep = lineages[group_cols].notna().all(axis=1).to_numpy()
+        kept = lineages[keep]
+        level_codes = kept.groupby(group_cols, observed=True).ngroup().to_numpy()
+
+        # lineage -> level group (-1 where a rank is missing), then per row
+        lineage_to_level = np.full(len(lineages), -1)
+        lineage_to_level[keep] = level_codes
+        codes = lineage_to_level[lineage_codes]
+        in_level = codes >= 0
+
+        keys = kept[group_cols].iloc[np.unique(level_codes, return_index=True)[1]]
+        yield level, _summarise_runs(keys, codes[in_level], values[in_level])
+
+
+def write_level(summary: pd.DataFrame, level: str):
+    """Write one level's summary to cache/ twice.
+
+    cache/<level>.parquet holds the whole level in lineage order and is
+    what full loads read.  cache/<level>/ holds the same rows partitioned
+    by `initial`, so an exact-name read only opens one small file.
+    """
+    # zstd keeps the files small; 8k-row groups with statistics let
+    # readers skip row groups when filtering by name
+    summary.to_parquet(
+        os.path.join(CACHE_DIR, f"{level}.parquet"),
+        index=False,
+        engine="pyarrow",
+        compression="zstd",
+        compression_level=3,
+        use_dictionary=True,
+        row_group_size=8192,
+        write_statistics=True,
+    )
+
+    out = os.path.join(CACHE_DIR, level)
+    # delete_matching would only replace the partitions this build writes;
+    # an initial that no longer occurs would keep serving its old rows
+    shutil.rmtree(out, ignore_errors=True)
+    ds.write_dataset(
+        pa.Table.from_pandas(
+            summary.assign(initial=summary[level].str[:1]), preserve_index=False
+        ),
+        out,
+        format="parquet",
+        partitioning=PARTITIONING,
+        file_options=ds.ParquetFileFormat().make_write_options(
+            compression="zstd",
+            compression_level=3,
+            use_dictionary=True,
+            write_statistics=True,
+        ),
+        max_rows_per_group=8192,
+    )
+
+
+def parquet_fingerprint() -> str:
+    """Size and mtime of every cache/<level>.parquet, as one string."""
+    parts = []
+    for level in TAXONOMY_LEVELS:
+        st = os.stat(os.path.join(CACHE_DIR, f"{level}.parquet"))
+        parts.append(f"{level}:{st.st_size}:{st.st_mtime_ns}")
+    return ";".join(parts)
+
+
+def write_all_levels(summaries: list[pd.DataFrame], out: str):
+    """Write every level's summary into one Arrow IPC file.
+
+    Rows are concatenated domain → species with a `level_id` column
+    (index into TAXONOMY_LEVELS); ranks below a row's level are null.
+    growth_rate.py memory-maps this file instead of decoding seven
+    parquet files on every CLI start.  The schema metadata records the
+    format version and the parquet files it was built alongside, so a
+    copy that no longer matches them is ignored.
+    """
+    tables = [
+        pa.Table.from_pandas(summary, preserve_index=False)
+        .replace_schema_metadata()
+        .append_column("level_id", pa.array(np.full(len(summary), i, dtype=np.int8)))
+        for i, summary in enumerate(summaries)
+    ]
+    table = pa.concat_tables(tables, promote_options="default")
+    table = table.select(
+        TAXONOMY_LEVELS + [c for c in table.column_names if c not in TAXONOMY_LEVELS]
+    ).replace_schema_metadata(
+        {"format": ALL_LEVELS_FORMAT, "source": parquet_fingerprint()}
+    )
+    with pa.ipc.new_file(out, table.schema) as writer:
+        writer.write_table(table)
+
+
 def main():
     download_csv()
 
     print("Reading CSV …")
-    df = pd.read_csv(CSV_FILE)
+    # pyarrow parses blocks in parallel and only the two columns we use
+    table = pacsv.read_csv(
+        CSV_FILE,
+        read_options=pacsv.ReadOptions(use_threads=True, block_size=64 << 20),
+        # empty cells are missing values, as pd.read_csv treated them
+        convert_options=pacsv.ConvertOptions(
+            include_columns=["taxonomy", "combopred"], strings_can_be_null=True
+        ),
+    )
 
     print("Parsing taxonomy …")
-    df = parse_taxonomy(df)
+    # taxonomy is split on Arrow kernels; pandas only ever sees the parsed
+    # rank columns and combopred
+    table = parse_taxonomy(table)
+    df = table.select(TAXONOMY_LEVELS + ["combopred"]).to_pandas(types_mapper=pd.ArrowDtype)
+    # names repeat heavily (two domains over ~10^5 rows), so group on
+    # integer category codes instead of hashing strings at every level
+    for level in TAXONOMY_LEVELS:
+        df[level] = df[level].astype("category")
 
     os.makedirs(CACHE_DIR, exist_ok=True)
 
-    for level in TAXONOMY_LEVELS:
-        print(f"  Summarising at {level} level …")
-        summary = summarise_level(df, level)
-        out = os.path.join(CACHE_DIR, f"{level}.parquet")
-        summary.to_parquet(out, index=False)
-        print(f"    → {out}  ({len(summary)} rows)")
+    print("Summarising …")
+    summaries = []
+    for level, summary in summarise_levels(df):
+        # Parquet dictionary-encodes the name columns itself; written as
+        # Categoricals instead, pyarrow repeats the whole category list in
+        # every row group, which roughly doubles the species files.
+        key_cols = TAXONOMY_LEVELS[: TAXONOMY_LEVELS.index(level) + 1]
+        summary[key_cols] = summary[key_cols].astype("string[pyarrow]")
+        write_level(summary, level)
+        out = os.path.join(CACHE_DIR, level)
+        print(f"    → {out}.parquet, {out}/  ({len(summary)} rows)")
+        summaries.append(summary)
+
+    write_all_levels(summaries, ALL_LEVELS_FILE)
+    print(f"    → {ALL_LEVELS_FILE}")
 
     print("\nBuild complete.")
 
@@ -26,11 +26,17 @@ Usage (API):
 """
 
 import argparse
-import json
+import bisect
+import functools
 import os
 import sys
 
+import numpy as np
+import orjson
 import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+import pyarrow.dataset as ds
 from rapidfuzz import fuzz, process
 
 # ── optional Flask import (graceful if missing) ──────────────────────
@@ -47,35 +53,286 @@ STAT_CHOICES = ["mean", "median", "min", "max", "range", "std", "se", "count"]
 
 # ── data loading ─────────────────────────────────────────────────────
 
-_cache: dict[str, pd.DataFrame] = {}
+# level -> (summary df grouped by name, unique candidate names, name -> code,
+#           row bounds per code, candidate names sorted for prefix search)
+_cache: dict[str, tuple[pd.DataFrame, list[str], dict, list[int], list[str]]] = {}
+_datasets: dict[str, ds.Dataset] = {}
+_partitions: dict[str, ds.Dataset | None] = {}
 
 
-def _load_level(level: str) -> pd.DataFrame:
-    if level not in _cache:
-        path = os.path.join(CACHE_DIR, f"{level}.parquet")
-        if not os.path.exists(path):
-            raise FileNotFoundError(
-                f"{path} not found – run build.py first."
+# besides cache/<level>.parquet, build.py writes each level as a parquet
+# dataset partitioned by the first character of its names
+# (cache/<level>/initial=<c>/…) for exact-name reads; it is not committed,
+# so it may be missing
+_PARTITIONING = ds.partitioning(pa.schema([("initial", pa.string())]), flavor="hive")
+
+
+def _level_path(level: str) -> str:
+    path = os.path.join(CACHE_DIR, f"{level}.parquet")
+    if not os.path.exists(path):
+        raise FileNotFoundError(
+            f"{path} not found – run build.py first."
+        )
+    return path
+
+
+# must match ALL_LEVELS_FORMAT in build.py
+_ALL_LEVELS_FORMAT = b"1"
+
+
+def _parquet_fingerprint() -> bytes | None:
+    """Size and mtime of every cache/<level>.parquet, as build.py records them."""
+    parts = []
+    for level in TAXONOMY_LEVELS:
+        try:
+            st = os.stat(os.path.join(CACHE_DIR, f"{level}.parquet"))
+        except FileNotFoundError:
+            return None
+        parts.append(f"{level}:{st.st_size}:{st.st_mtime_ns}")
+    return ";".join(parts).encode()
+
+
+@functools.lru_cache(maxsize=1)
+def _open_all_levels() -> pa.Table | None:
+    """Memory-map cache/all_levels.arrow (written by build.py), if present.
+
+    The file is git-ignored and can outlive the parquet files it was built
+    from (a pull, a partial rebuild, an older build.py), so it is only used
+    while its stamp matches them; otherwise the parquet files are read.
+    Memoised either way, so a missing or stale file is only checked once.
+    """
+    path = os.path.join(CACHE_DIR, "all_levels.arrow")
+    if not os.path.exists(path):
+        return None
+    reader = pa.ipc.open_file(pa.memory_map(path, "r"))
+    meta = reader.schema.metadata or {}
+    if (
+        meta.get(b"format") != _ALL_LEVELS_FORMAT
+        or meta.get(b"source") != _parquet_fingerprint()
+    ):
+        return None
+    return reader.read_all()
+
+
+def _open_dataset(level: str) -> ds.Dataset:
+    if level not in _datasets:
+        table = _open_all_levels()
+        if table is None:
+            _datasets[level] = ds.dataset(_level_path(level), format="parquet")
+        else:
+            idx = TAXONOMY_LEVELS.index(level)
+            drop = set(TAXONOMY_LEVELS[idx + 1:]) | {"level_id"}
+            # build.py writes the levels contiguously in level_id order, so
+            # a level is a zero-copy slice of the memory map
+            start, stop = np.searchsorted(table.column("level_id").to_numpy(), [idx, idx + 1])
+            rows = table.slice(start, stop - start)
+            _datasets[level] = ds.dataset(
+                rows.select([c for c in rows.column_names if c not in drop])
             )
-        _cache[level] = pd.read_parquet(path)
+    return _datasets[level]
+
+
+def _open_partitions(level: str) -> ds.Dataset | None:
+    if level not in _partitions:
+        path = os.path.join(CACHE_DIR, level)
+        _partitions[level] = (
+            ds.dataset(path, format="parquet", partitioning=_PARTITIONING)
+            if os.path.isdir(path)
+            else None
+        )
+    return _partitions[level]
+
+
+# keep name columns in Arrow memory when converting to pandas, rather than
+# one Python str object per cell (pandas < 3 defaults to object dtype)
+_ARROW_STRINGS = {
+    pa.string(): pd.StringDtype("pyarrow"),
+    pa.large_string(): pd.StringDtype("pyarrow"),
+}
+
+
+def _load_level(level: str) -> tuple[pd.DataFrame, list[str], dict, list[int], list[str]]:
+    if level not in _cache:
+        # full loads read the single lineage-ordered copy, never the
+        # partitions, so candidate order (and fuzzy tie-breaking) is the
+        # same whichever source is used
+        df = _open_dataset(level).to_table().to_pandas(types_mapper=_ARROW_STRINGS.get)
+        # built once per level so fuzzy lookups don't rebuild them per query
+        candidates, order, idx_map, bounds = _name_index(df[level])
+        # keep each name's rows contiguous so a hit is one slice of df
+        df = df.take(order).reset_index(drop=True)
+        _cache[level] = (df, candidates, idx_map, bounds, sorted(candidates))
     return _cache[level]
 
 
-# ── lookup helpers ───────────────────────────────────────────────────
+def _name_index(
+    names: pd.Series,
+) -> tuple[list[str], np.ndarray, dict[str, int], list[int]]:
+    """Return (unique names in order of appearance, row order, name -> code,
+    row bounds per code).
+
+    One factorize plus a stable sort of the integer codes; in that row
+    order the rows of code i are bounds[i]:bounds[i + 1].  Mapping names to
+    ints rather than to an array each keeps the garbage collector out of
+    building the index.
+    """
+    codes, uniques = pd.factorize(names, sort=False)
+    order = np.argsort(codes, kind="stable")
+    order = order[np.count_nonzero(codes < 0):]  # NaN names sort first as -1
+    counts = np.bincount(codes[codes >= 0], minlength=len(uniques))
+    bounds = [0] + counts.cumsum().tolist()
+    candidates = uniques.tolist()
+    return candidates, order, dict(zip(candidates, range(len(candidates)))), bounds
+
+
+# every level's candidates concatenated, the level index of each name, and
+# each name's coarsest level (for one-probe exact matches)
+_all_candidates: tuple[list[str], np.ndarray, dict[str, str]] | None = None
+
+
+def _load_all_candidates() -> tuple[list[str], np.ndarray, dict[str, str]]:
+    global _all_candidates
+    if _all_candidates is None:
+        names: list[str] = []
+        level_ids: list[int] = []
+        name_levels: dict[str, str] = {}
+        for i, level in enumerate(TAXONOMY_LEVELS):
+            candidates = _load_level(level)[1]
+            names.extend(candidates)
+            level_ids.extend([i] * len(candidates))
+        # fill finest first so a name found at several levels keeps the
+        # coarsest, as the per-level exact scan does
+        for level in reversed(TAXONOMY_LEVELS):
+            name_levels.update(dict.fromkeys(_cache[level][1], level))
+        _all_candidates = (names, np.array(level_ids), name_levels)
+    return _all_candidates
+
+
+def clear_cache():
+    """Drop every loaded level and memoised match (e.g. after re-running build.py)."""
+    global _all_candidates
+    _cache.clear()
+    _datasets.clear()
+    _partitions.clear()
+    _all_candidates = None
+    _open_all_levels.cache_clear()
+    _fuzzy_match.cache_clear()
 
-def _exact_lookup(df: pd.DataFrame, level: str, name: str) -> pd.DataFrame:
-    return df[df[level] == name]
 
+# ── lookup helpers ───────────────────────────────────────────────────
 
-def _fuzzy_lookup(df: pd.DataFrame, level: str, name: str, score_cutoff: int = 50):
+def _exact_lookup(level: str, name: str, lazy: bool = False) -> pd.DataFrame:
+    if lazy and level not in _cache:
+        # push the name filter down so the level stays unloaded: to the
+        # memory-mapped table if there is one, else to the partition for
+        # the name's initial, else to the level's single parquet file
+        partitions = _open_partitions(level) if _open_all_levels() is None else None
+        if partitions is None:
+            hits = _open_dataset(level).to_table(filter=pc.field(level) == name)
+        else:
+            hits = partitions.to_table(
+                filter=(pc.field("initial") == name[:1]) & (pc.field(level) == name)
+            ).drop_columns(["initial"])
+        return hits.to_pandas(types_mapper=_ARROW_STRINGS.get)
+    df, _, idx_map, bounds, _ = _load_level(level)
+    code = idx_map.get(name)
+    if code is None:
+        return df.iloc[:0]
+    return df.iloc[bounds[code]:bounds[code + 1]]
+
+
+def _exact_any_level(name: str, lazy: bool = False) -> tuple[str, pd.DataFrame] | None:
+    """Return (level, rows) for the coarsest level holding `name` exactly."""
+    if not lazy:
+        # every level ends up in memory anyway: one dict probe, not seven
+        level = _load_all_candidates()[2].get(name)
+        return (level, _exact_lookup(level, name)) if level else None
+    # A miss falls through to a fuzzy pass that loads every level, so
+    # filtered reads here would only be thrown away; load coarse to fine
+    # and stop at the first level that has the name.
+    for level in TAXONOMY_LEVELS:
+        hits = _exact_lookup(level, name)
+        if not hits.empty:
+            return level, hits
+    return None
+
+
+# A binomial asked for at a coarser rank ("escherichia coli" --genus) is
+# also matched on its first word; that score is scaled down the way WRatio
+# scales partial matches, so it never outranks a near-exact full match.
+_FIRST_WORD_SCALE = 0.9
+# shorter first words ("e coli") are abbreviations that would only match
+# tiny unrelated names ("e2")
+_FIRST_WORD_MIN_LEN = 3
+
+
+def _extract_one(name: str, candidates: list[str], sorted_names: list[str], score_cutoff: float):
+    """Return (name, score) for the best candidate, or None."""
+    # A query that starts some names ("pseudo" → "pseudomonas", …) is
+    # scored against just those; otherwise against the whole level.
+    lo = bisect.bisect_left(sorted_names, name)
+    hi = bisect.bisect_right(sorted_names, name + "\uffff")
+    for pool in (sorted_names[lo:hi], candidates):
+        if pool:
+            result = process.extractOne(
+                name, pool, scorer=fuzz.ratio, processor=None, score_cutoff=score_cutoff
+            )
+            if result is not None:
+                return result[0], result[1]
+    return None
+
+
+@functools.lru_cache(maxsize=4096)
+def _fuzzy_match(level: str | None, name: str, score_cutoff: int = 50):
+    """Return (matched_level, matched_name, score) or None.
+
+    Searches one level, or every level when `level` is None.  Memoised
+    because the API sees the same queries over and over.
+    """
+    # Taxon names are short and already lowercased by build.py, so a plain
+    # Indel ratio is enough; WRatio's token/partial passes only add cost.
+    first_word = name.split(" ", 1)[0]
+    try_first_word = first_word != name and len(first_word) >= _FIRST_WORD_MIN_LEN
+    if level is not None:
+        _, candidates, _, _, sorted_names = _load_level(level)
+        result = _extract_one(name, candidates, sorted_names, score_cutoff)
+        if level != "species" and try_first_word:
+            hit = _extract_one(
+                first_word, candidates, sorted_names, score_cutoff / _FIRST_WORD_SCALE
+            )
+            if hit is not None and (result is None or hit[1] * _FIRST_WORD_SCALE > result[1]):
+                result = hit[0], hit[1] * _FIRST_WORD_SCALE
+        if result is None:
+            return None
+        return level, result[0], result[1]
+
+    # score the whole corpus in one call and keep the best; argmax
+    # favours the coarsest level on ties
+    names, level_ids, _ = _load_all_candidates()
+    scores = process.cdist(
+        [name], names, scorer=fuzz.ratio, processor=None,
+        score_cutoff=score_cutoff, dtype=np.float64, workers=-1,
+    )[0]
+    if try_first_word:
+        word_scores = process.cdist(
+            [first_word], names, scorer=fuzz.ratio, processor=None,
+            score_cutoff=score_cutoff / _FIRST_WORD_SCALE, dtype=np.float64, workers=-1,
+        )[0] * _FIRST_WORD_SCALE
+        word_scores[level_ids == TAXONOMY_LEVELS.index("species")] = 0
+        scores = np.maximum(scores, word_scores)
+    best = int(scores.argmax())
+    if scores[best] == 0:
+        return None
+    return TAXONOMY_LEVELS[level_ids[best]], names[best], float(scores[best])
+
+
+def _fuzzy_lookup(level: str, name: str, score_cutoff: int = 50):
     """Return (matched_rows, matched_name, score)."""
-    candidates = df[level].dropna().unique().tolist()
-    result = process.extractOne(name, candidates, scorer=fuzz.WRatio, score_cutoff=score_cutoff)
-    if result is None:
+    match = _fuzzy_match(level, name, score_cutoff)
+    if match is None:
         return pd.DataFrame(), None, 0
-    matched_name, score, _ = result
-    rows = df[df[level] == matched_name]
-    return rows, matched_name, score
+    _, matched_name, score = match
+    return _exact_lookup(level, matched_name), matched_name, score
 
 
 def _row_to_dict(row: pd.Series, level: str) -> dict:
@@ -97,35 +354,33 @@ def _row_to_dict(row: pd.Series, level: str) -> dict:
     }
 
 
-def _search_all_levels(name: str):
-    """Search every level for an exact or fuzzy match; return best."""
-    name_lower = name.strip().lower()
+def _rows_to_records(rows: pd.DataFrame, level: str) -> list[dict]:
+    # hits are a handful of rows (one per name in practice), where iterrows
+    # beats to_dict("records") and its per-call setup
+    return [_row_to_dict(r, level) for _, r in rows.iterrows()]
+
 
+def _search_all_levels(name: str, name_lower: str, lazy: bool = False):
+    """Search every level for an exact or fuzzy match; return best."""
     # 1) exact match across all levels
-    for level in TAXONOMY_LEVELS:
-        df = _load_level(level)
-        hits = _exact_lookup(df, level, name_lower)
-        if not hits.empty:
-            records = [_row_to_dict(r, level) for _, r in hits.iterrows()]
-            return {
-                "query": name,
-                "matched_name": name_lower,
-                "matched_level": level,
-                "match_score": 100,
-                "results": records,
-            }
+    exact = _exact_any_level(name_lower, lazy)
+    if exact:
+        level, hits = exact
+        records = _rows_to_records(hits, level)
+        return {
+            "query": name,
+            "matched_name": name_lower,
+            "matched_level": level,
+            "match_score": 100,
+            "results": records,
+        }
 
     # 2) fuzzy across all levels – pick best score
-    best = None
-    for level in TAXONOMY_LEVELS:
-        df = _load_level(level)
-        rows, matched, score = _fuzzy_lookup(df, level, name_lower)
-        if matched and (best is None or score > best[2]):
-            best = (level, rows, score, matched)
-
-    if best:
-        level, rows, score, matched = best
-        records = [_row_to_dict(r, level) for _, r in rows.iterrows()]
+    match = _fuzzy_match(None, name_lower)
+    if match:
+        level, matched, score = match
+        rows = _exact_lookup(level, matched)
+        records = _rows_to_records(rows, level)
         return {
             "query": name,
             "matched_name": matched,
@@ -137,21 +392,18 @@ def _search_all_levels(name: str):
     return {"query": name, "error": "No match found at any taxonomic level."}
 
 
-def _search_level(name: str, level: str):
+def _search_level(name: str, name_lower: str, level: str, lazy: bool = False):
     """Search a specific level; fall back to scanning all levels."""
-    name_lower = name.strip().lower()
     level_lower = level.strip().lower()
 
     if level_lower not in TAXONOMY_LEVELS:
         # Maybe the user's "level" is actually a taxon name – try all.
-        return _search_all_levels(name)
-
-    df = _load_level(level_lower)
+        return _search_all_levels(name, name_lower, lazy)
 
     # exact
-    hits = _exact_lookup(df, level_lower, name_lower)
+    hits = _exact_lookup(level_lower, name_lower, lazy)
     if not hits.empty:
-        records = [_row_to_dict(r, level_lower) for _, r in hits.iterrows()]
+        records = _rows_to_records(hits, level_lower)
         return {
             "query": name,
             "matched_name": name_lower,
@@ -161,9 +413,9 @@ def _search_level(name: str, level: str):
         }
 
     # fuzzy at requested level
-    rows, matched, score = _fuzzy_lookup(df, level_lower, name_lower)
+    rows, matched, score = _fuzzy_lookup(level_lower, name_lower)
     if matched:
-        records = [_row_to_dict(r, level_lower) for _, r in rows.iterrows()]
+        records = _rows_to_records(rows, level_lower)
         return {
             "query": name,
             "matched_name": matched,
@@ -173,7 +425,7 @@ def _search_level(name: str, level: str):
         }
 
     # fall back: maybe they said --order but it's actually a family, etc.
-    fallback = _search_all_levels(name)
+    fallback = _search_all_levels(name, name_lower, lazy)
     if "error" not in fallback:
         fallback["note"] = (
             f"'{name}' was not found at the '{level_lower}' level. "
@@ -182,11 +434,20 @@ def _search_level(name: str, level: str):
     return fallback
 
 
-def lookup(query: str, level: str | None = None, stat: str | None = None):
+def lookup(query: str, level: str | None = None, stat: str | None = None, lazy: bool = False):
+    """Look up `query`, optionally at one `level`, and return a JSON-ready dict.
+
+    Levels are loaded whole and kept in memory for later calls.  A one-shot
+    caller such as the CLI passes lazy=True, so an exact hit at the
+    requested level only reads that name's rows from disk.
+    """
+    # candidates are stored lowercased and stripped by build.py, so the
+    # query is normalised once here and matched with no further processing
+    name_lower = query.strip().lower()
     if level:
-        result = _search_level(query, level)
+        result = _search_level(query, name_lower, level, lazy)
     else:
-        result = _search_all_levels(query)
+        result = _search_all_levels(query, name_lower, lazy)
 
     # If a specific stat was requested, simplify the output
     if stat and "results" in result:
@@ -246,7 +507,10 @@ def create_app():
         stat = request.args.get("stat", None)
         result = lookup(query, level=level, stat=stat)
         status = 200 if "error" not in result else 404
-        return jsonify(result), status
+        # orjson serialises the float-heavy result far faster than jsonify;
+        # keys are sorted as jsonify sorts them
+        body = orjson.dumps(result, option=orjson.OPT_SORT_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+        return app.response_class(body, mimetype="application/json"), status
 
     @app.route("/levels", methods=["GET"])
     def levels_endpoint():
@@ -283,8 +547,11 @@ def main():
     level = args.level or getattr(args, "level_flag", None)
     stat = args.stat or getattr(args, "stat_flag", None)
 
-    result = lookup(args.query, level=level, stat=stat)
-    print(json.dumps(result, indent=2))
+    # one query per process: don't load levels the answer doesn't need
+    result = lookup(args.query, level=level, stat=stat, lazy=True)
+    sys.stdout.buffer.write(
+        orjson.dumps(result, option=orjson.OPT_INDENT_2 | orjson.OPT_SERIALIZE_NUMPY) + b"\n"
+    )
 
 
 if __name__ == "__main__":